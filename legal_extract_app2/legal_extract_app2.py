@@ -2,51 +2,99 @@
 """
 多源异构裁判文书结构化提取工具 - Mac本地稳定版
 适配：Mac Intel/M1/M2全芯片 | 基于Tesseract OCR+DeepSeek API
-支持格式：DOCX/可编辑PDF/扫描件PDF/JPG/PNG/TXT | 批量处理 | Excel一键导出
+支持格式：DOCX/可编辑PDF/扫描件PDF/JPG/PNG/TXT | 批量处理 | Excel/CSV/Parquet一键导出
 本地运行：无需部署，装依赖后直接启动，数据全程本地处理更安全
 """
 import streamlit as st
 import openai
+import httpx
 import json
+import asyncio
+import hashlib
+import statistics
+import functools
 import traceback
+import logging
 from docx import Document
 import pdfplumber
 import pandas as pd
+from openpyxl import Workbook
 from pathlib import Path
-import tempfile
+import io
+from typing import BinaryIO, Union
 from datetime import datetime
-import pdf2image
+import fitz  # PyMuPDF
 from PIL import Image
-import pytesseract
+import numpy as np
+from numba import njit
+import os
+# 多页并行OCR时每个线程单独识别，关闭Tesseract内部OpenMP多线程（须在加载libtesseract前设置）
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+# tesserocr 2.10起依赖cysignals，导入时注册信号处理，只能在主线程执行；Streamlit在脚本线程运行本文件，requirements.txt限定<2.10
+import tesserocr
+from tesserocr import PyTessBaseAPI, PSM, OEM
 import subprocess
-import sys
+import shutil
+import urllib.request
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+logger = logging.getLogger(__name__)
 
 # ===== 跨平台适配：Tesseract OCR初始化（本地Mac + 云端Linux）=====
-def setup_tesseract():
+def setup_tesseract() -> tuple:
+    """检查Tesseract语言包，只返回检查结果(tessdata路径, 缺失语言包列表, 失败原因)，页面提示由main()负责"""
     try:
-        # 云端Linux：尝试多个常见路径
-        possible_paths = [
-            '/usr/bin/tesseract',
-            '/usr/local/bin/tesseract',
-            '/opt/homebrew/bin/tesseract'
-        ]
-        for path in possible_paths:
-            try:
-                pytesseract.pytesseract.tesseract_cmd = path
-                pytesseract.get_tesseract_version()
-                st.toast(f"✅ Tesseract配置成功，路径：{path}", icon="☁️")
-                break
-            except:
+        # tesserocr直接调用libtesseract，只需确认语言包可用（中文+英文）
+        tessdata_path, languages = tesserocr.get_languages()
+        missing_langs = [lang for lang in ("chi_sim", "eng") if lang not in languages]
+        if missing_langs:
+            return tessdata_path, missing_langs, f"未找到语言包{'、'.join(missing_langs)}（tessdata路径：{tessdata_path}），请检查packages.txt是否正确"
+        return tessdata_path, [], ""
+    except Exception as e:
+        return "", [], str(e)
+
+# 可下载的识别模型：fast整数量化模型比best浮点模型快3-5倍，印刷体法律文书精度损失约1-2个百分点
+# 系统自带语言包（Homebrew tesseract-lang、Debian tesseract-ocr-chi-sim等）通常即为fast版本，best需单独下载
+TESSDATA_MODEL_DIRS = {model: Path.home() / ".tesseract" / f"tessdata_{model}" for model in ("fast", "best")}
+TESSDATA_MODEL_URL = "https://github.com/tesseract-ocr/tessdata_{model}/raw/main/{lang}.traineddata"
+
+def ensure_model_tessdata(ocr_model: str) -> str:
+    """
+    确保fast/best模型语言包（中文+英文）已在各自目录，缺失时才联网下载（仅下载模型文件，不上传任何文书数据）：
+    返回空字符串表示可用，否则返回失败原因；不缓存结果，下载失败后再次选择该模型提取时会重试
+    """
+    try:
+        model_dir = TESSDATA_MODEL_DIRS[ocr_model]
+        model_dir.mkdir(parents=True, exist_ok=True)
+        for lang in ("chi_sim", "eng"):
+            traineddata_path = model_dir / f"{lang}.traineddata"
+            if traineddata_path.exists():
                 continue
-        else:
-            raise Exception("未找到Tesseract，请检查packages.txt是否正确")
+            # 先写入临时文件再改名，避免下载中断留下不完整的语言包（文件名含线程号，多会话同时下载互不干扰）
+            download_path = traineddata_path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.download")
+            try:
+                with urllib.request.urlopen(TESSDATA_MODEL_URL.format(model=ocr_model, lang=lang), timeout=60) as response, \
+                        open(download_path, "wb") as f:
+                    shutil.copyfileobj(response, f)
+                download_path.replace(traineddata_path)
+            finally:
+                # 下载失败时清理残留的临时文件（成功时已改名，此处为空操作）
+                download_path.unlink(missing_ok=True)
+        return ""
     except Exception as e:
-        st.error(f"❌ Tesseract配置失败：{str(e)}")
-        st.info("💡 请确认packages.txt在根目录，且包含tesseract-ocr、tesseract-ocr-chi-sim、poppler-utils")
-        sys.exit(1)
+        return str(e)
 
-# 初始化Tesseract（跨平台适配，启动时自动执行）
-setup_tesseract()
+@st.cache_resource(show_spinner=False)
+def init_tesseract() -> tuple:
+    """
+    初始化Tesseract（跨平台适配）：
+    Streamlit每次交互都会重新执行整个脚本，缓存后整个进程只检查一次语言包；
+    缓存函数内不调用st.toast等页面元素（缓存命中时无法回放），只返回检查结果
+    """
+    return setup_tesseract()
 
 # ===== 全局配置（可根据需求增删提取字段）=====
 # 核心法律提取字段，固定11项，适配多数裁判文书
@@ -57,138 +105,272 @@ REQUIRED_FIELDS = [
 TEXT_CUT_LENGTH = 3000  # 控制API Token消耗，3000字足够提取核心信息
 DEEPSEEK_API_BASE = "https://api.deepseek.com/v1"  # DeepSeek API固定地址
 DEEPSEEK_MODEL = "deepseek-chat"  # 通用对话模型，适配文本提取
+PDF_TEXT_PROBE_PAGES = 3  # 判断可编辑/扫描件PDF时探测的前几页页数
+OCR_FAST_DPI = 150  # 扫描件PDF首轮渲染分辨率，常规正文字号已足够识别
+OCR_FULL_DPI = 300  # 识别置信度不足的页面按此分辨率重新渲染识别
+OCR_MIN_CONFIDENCE = 70  # 单页词置信度中位数低于此值则提升分辨率重识别
+LLM_MAX_CONCURRENCY = 8  # 同时在途的DeepSeek请求上限，适配单Key并发限制
+# 结果导出格式：Excel便于直接查看，CSV/Parquet适合大批量结果快速导出
+EXPORT_FORMATS = {"xlsx": "Excel", "csv": "CSV", "parquet": "Parquet"}
 
 # ===== Tesseract OCR核心函数（Mac本地稳定版）=====
-def tesseract_ocr_image(image_path: str) -> str:
-    """识别单张图片（JPG/PNG/BMP），优化法律文书中文识别"""
-    try:
-        img = Image.open(image_path)
+@st.cache_resource(show_spinner=False)
+def _ocr_runtime() -> tuple:
+    """
+    常驻OCR线程池：每个工作线程持有独立的Tesseract引擎句柄（PyTessBaseAPI非线程安全），
+    线程常驻即可跨批次复用句柄，避免重复加载语言模型；缓存后脚本重新执行也不会重复创建线程池
+    """
+    ocr_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="tesseract-ocr")
+    tess_local = threading.local()
+    tess_apis = []  # 记录所有已创建的句柄，进程退出时统一释放
+
+    def release_tess_apis():
+        for api in tess_apis:
+            api.End()
+
+    atexit.register(release_tess_apis)
+    return ocr_pool, tess_local, tess_apis
+
+_OCR_POOL, _TESS_LOCAL, _TESS_APIS = _ocr_runtime()
+
+def _get_tess_api(ocr_model: str = "system") -> PyTessBaseAPI:
+    """当前线程首次使用某个识别模型（system/fast/best）时初始化Tesseract引擎，后续直接复用"""
+    if not hasattr(_TESS_LOCAL, "apis"):
+        _TESS_LOCAL.apis = {}
+    api = _TESS_LOCAL.apis.get(ocr_model)
+    if api is None:
+        # fast/best模型从各自的下载目录加载（提取前已确保语言包就绪，否则回退system），system使用系统默认语言包
+        model_kwargs = {"path": f"{TESSDATA_MODEL_DIRS[ocr_model]}/"} if ocr_model in TESSDATA_MODEL_DIRS else {}
         # 最优配置：中文+英文混合识别 + LSTM引擎 + 单一文本块（适配法律文书排版）
-        ocr_text = pytesseract.image_to_string(
-            img,
+        api = PyTessBaseAPI(
             lang='chi_sim+eng',  # chi_sim=简体中文，eng=英文（识别案号/数字）
-            config='--psm 6 --oem 3'
+            psm=PSM.SINGLE_BLOCK,
+            oem=OEM.LSTM_ONLY,
+            **model_kwargs
         )
-        return ocr_text.strip() if ocr_text.strip() else "OCR识别失败：图片无有效文本内容"
+        _TESS_LOCAL.apis[ocr_model] = api
+        _TESS_APIS.append(api)
+    return api
+
+@njit(nogil=True, cache=True)
+def _otsu_binarize(gray_arr: np.ndarray) -> np.ndarray:
+    """
+    Otsu法二值化（numba单线程编译，释放GIL；各页已在OCR线程池中并行，内核内不再嵌套并行）：
+    1. 统计灰度直方图
+    2. 取使前景/背景类间方差最大的灰度值为阈值，逐像素二值化
+    """
+    n_rows, n_cols = gray_arr.shape
+    hist = np.zeros(256, np.int64)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            hist[gray_arr[i, j]] += 1
+
+    total_pixels = n_rows * n_cols
+    sum_all = 0.0
+    for t in range(256):
+        sum_all += t * hist[t]
+    weight_bg = 0.0
+    sum_bg = 0.0
+    best_between_var = -1.0
+    threshold = 0
+    for t in range(256):
+        weight_bg += hist[t]
+        weight_fg = total_pixels - weight_bg
+        if weight_bg == 0:
+            continue
+        if weight_fg == 0:
+            break
+        sum_bg += t * hist[t]
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        between_var = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if between_var > best_between_var:
+            best_between_var = between_var
+            threshold = t
+
+    binary_arr = np.empty((n_rows, n_cols), np.uint8)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            binary_arr[i, j] = 255 if gray_arr[i, j] > threshold else 0
+    return binary_arr
+
+def _binarize_image(img: Image.Image) -> Image.Image:
+    """二值化预处理：转灰度 + Otsu二值化，减少Tesseract版面分析和识别的计算量（与识别模型选择相互独立）"""
+    gray_arr = np.ascontiguousarray(img.convert("L"), dtype=np.uint8)
+    return Image.fromarray(_otsu_binarize(gray_arr))
+
+def _ocr_pil_image_with_conf(img: Image.Image, binarize: bool = False, ocr_model: str = "system") -> tuple:
+    """在OCR线程池内执行：用本线程的引擎句柄识别一张内存图片，返回(文本, 词置信度中位数)"""
+    if binarize:
+        img = _binarize_image(img)
+    api = _get_tess_api(ocr_model)
+    api.SetImage(img)
+    ocr_text = api.GetUTF8Text().strip()
+    # 无任何识别词（如空白页）时置信度记为None，不触发高分辨率重识别
+    word_confidences = api.AllWordConfidences()
+    median_conf = statistics.median(word_confidences) if word_confidences else None
+    return (ocr_text if ocr_text else "OCR识别失败：图片无有效文本内容"), median_conf
+
+def _ocr_pil_image(img: Image.Image, binarize: bool = False, ocr_model: str = "system") -> str:
+    """在OCR线程池内执行：用本线程的引擎句柄识别一张内存图片"""
+    return _ocr_pil_image_with_conf(img, binarize, ocr_model)[0]
+
+def tesseract_ocr_image(img_or_path, binarize: bool = False, ocr_model: str = "system") -> str:
+    """识别单张图片（JPG/PNG/BMP路径、文件流或内存中的PIL图片），优化法律文书中文识别；binarize=True时先灰度二值化，ocr_model选择system/fast/best识别模型"""
+    try:
+        # 已是内存图片（如扫描件PDF页）则直接识别，省去磁盘读写和PNG编解码
+        img = img_or_path if isinstance(img_or_path, Image.Image) else Image.open(img_or_path)
+        return _OCR_POOL.submit(_ocr_pil_image, img, binarize, ocr_model).result()
     except Exception as e:
         raise Exception(f"图片OCR识别异常：{str(e)}")
 
-def tesseract_ocr_scanned_pdf(pdf_path: Path) -> str:
-    """处理扫描件PDF：转300DPI高清图片 → 逐页OCR → 拼接内容（标记页码）"""
+def _open_pdf_document(pdf_source: Union[Path, BinaryIO]) -> fitz.Document:
+    """PyMuPDF打开PDF：支持本地路径或内存文件流（文件流直接从内存解析，无需落盘）"""
+    if isinstance(pdf_source, Path):
+        return fitz.open(pdf_source)
+    pdf_source.seek(0)
+    return fitz.open(stream=pdf_source.read(), filetype="pdf")
+
+def _render_pdf_pages(pdf_source: Union[Path, BinaryIO], dpi: int, page_nums: list = None) -> list:
+    """PDF进程内渲染为内存图片（PyMuPDF，无需poppler子进程和中间文件），page_nums指定则只渲染这些页（从1开始）"""
+    with _open_pdf_document(pdf_source) as pdf_doc:
+        pages = pdf_doc if page_nums is None else (pdf_doc[page_num - 1] for page_num in page_nums)
+        rendered_pages = []
+        for page in pages:
+            pix = page.get_pixmap(dpi=dpi, alpha=False)
+            rendered_pages.append(Image.frombytes("RGB", [pix.width, pix.height], pix.samples))
+        return rendered_pages
+
+def _adaptive_ocr(pdf_source: Union[Path, BinaryIO], binarize: bool = False, ocr_model: str = "system") -> list:
+    """
+    自适应分辨率OCR，返回各页识别文本：
+    1. 全部页面先按150DPI渲染并行识别（常规正文足够清晰，计算量约为300DPI的1/4）
+    2. 仅对置信度中位数不足的页面按300DPI重新渲染识别，两次结果取置信度更高的一次（噪点多的扫描件高分辨率不一定更准）
+    """
+    pages = _render_pdf_pages(pdf_source, OCR_FAST_DPI)
+    # 各页分发到OCR线程池并行识别，map按页码顺序返回结果
+    page_results = list(_OCR_POOL.map(functools.partial(_ocr_pil_image_with_conf, binarize=binarize, ocr_model=ocr_model), pages))
+    low_conf_page_nums = [
+        page_num for page_num, (_, median_conf) in enumerate(page_results, 1)
+        if median_conf is not None and median_conf < OCR_MIN_CONFIDENCE
+    ]
+    if low_conf_page_nums:
+        hires_pages = _render_pdf_pages(pdf_source, OCR_FULL_DPI, low_conf_page_nums)
+        hires_results = _OCR_POOL.map(functools.partial(_ocr_pil_image_with_conf, binarize=binarize, ocr_model=ocr_model), hires_pages)
+        for page_num, (hires_text, hires_conf) in zip(low_conf_page_nums, hires_results):
+            if hires_conf is not None and hires_conf > page_results[page_num - 1][1]:
+                page_results[page_num - 1] = (hires_text, hires_conf)
+    return [page_text for page_text, _ in page_results]
+
+def tesseract_ocr_scanned_pdf(pdf_source: Union[Path, BinaryIO], binarize: bool = False, ocr_model: str = "system") -> str:
+    """处理扫描件PDF：自适应分辨率转图片 → 多页并行OCR → 拼接内容（标记页码）；binarize=True时各页先灰度二值化，ocr_model选择system/fast/best识别模型"""
     try:
-        # 300DPI是法律文书OCR最优分辨率，兼顾速度和识别精度
-        pages = pdf2image.convert_from_path(
-            pdf_path.absolute(),
-            dpi=300,
-            fmt="png",
-            poppler_path=None  # Mac brew安装poppler后无需指定路径
-        )
         full_ocr_content = []
-        # 逐页识别并标记页码，方便大模型定位内容
-        for page_num, page in enumerate(pages, 1):
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp_img:
-                page.save(tmp_img.name, format="PNG")
-                page_ocr_text = tesseract_ocr_image(tmp_img.name)
-                full_ocr_content.extend([
-                    f"【扫描件PDF-第{page_num}页开始】",
-                    page_ocr_text,
-                    f"【扫描件PDF-第{page_num}页结束】\n"
-                ])
-                # 立即删除临时图片，释放Mac磁盘空间
-                Path(tmp_img.name).unlink(missing_ok=True)
+        # 标记页码，方便大模型定位内容
+        for page_num, page_ocr_text in enumerate(_adaptive_ocr(pdf_source, binarize, ocr_model), 1):
+            full_ocr_content.extend([
+                f"【扫描件PDF-第{page_num}页开始】",
+                page_ocr_text,
+                f"【扫描件PDF-第{page_num}页结束】\n"
+            ])
         return "".join(full_ocr_content)
     except Exception as e:
         raise Exception(f"扫描件PDF处理异常：{str(e)}")
 
 # ===== 多格式文本读取函数（Mac本地专用，兼容所有文书格式）=====
-def read_docx_file(file_path: Path) -> str:
-    """读取Word/DOCX文件，提取纯文本"""
+def read_docx_file(file_source: Union[Path, BinaryIO]) -> str:
+    """读取Word/DOCX文件（本地路径或内存文件流），提取纯文本"""
     try:
-        doc = Document(file_path)
-        doc_text = [para.text.strip() for para in doc.paragraphs if para.text.strip()]
-        return "\n".join(doc_text) if doc_text else "DOCX文件无有效文本内容"
+        doc = Document(file_source)
+        # 单次strip + 生成器过滤空段落，避免重复strip和中间列表
+        doc_text = "\n".join(filter(None, (para.text.strip() for para in doc.paragraphs)))
+        return doc_text if doc_text else "DOCX文件无有效文本内容"
     except Exception as e:
         raise Exception(f"DOCX读取异常：{str(e)}")
 
-def read_pdf_file(file_path: Path) -> str:
-    """读取可编辑PDF文件，提取纯文本（比OCR更快更准确）"""
+def _pdf_has_text(file_source: Union[Path, BinaryIO]) -> bool:
+    """只探测PDF前几页是否有文本层：有则为可编辑PDF，无则为扫描件（无需解析整份PDF）"""
+    with pdfplumber.open(file_source) as pdf:
+        return any(
+            (page.extract_text() or "").strip()
+            for page in pdf.pages[:PDF_TEXT_PROBE_PAGES]
+        )
+
+def read_pdf_file(file_source: Union[Path, BinaryIO]) -> str:
+    """读取可编辑PDF文件（本地路径或内存文件流），提取纯文本（比OCR更快更准确）"""
     try:
-        pdf_text = []
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    pdf_text.append(page_text.strip())
-        return "\n".join(pdf_text) if pdf_text else "PDF无有效文本内容"
+        with pdfplumber.open(file_source) as pdf:
+            # 单次生成器拼接各页文本（默认字符合并容差，与扫描件探测保持一致）
+            pdf_text = "\n".join(filter(None, (
+                (page.extract_text() or "").strip()
+                for page in pdf.pages
+            )))
+        return pdf_text if pdf_text else "PDF无有效文本内容"
     except Exception as e:
         raise Exception(f"可编辑PDF读取异常：{str(e)}")
 
-def read_txt_file(file_path: Path) -> str:
-    """读取TXT纯文本文件，兼容utf-8/gbk编码（解决Mac中文乱码）"""
+def read_txt_file(file_source: Union[Path, BinaryIO]) -> str:
+    """读取TXT纯文本文件（本地路径或内存文件流），兼容utf-8/gbk编码（解决Mac中文乱码）"""
     try:
+        raw_bytes = file_source.read_bytes() if isinstance(file_source, Path) else file_source.read()
         # 优先utf-8，失败则自动切换gbk，覆盖所有中文编码场景
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
-        except:
-            with open(file_path, "r", encoding="gbk") as f:
-                text = f.read()
+            text = raw_bytes.decode("utf-8")
+        except UnicodeDecodeError:
+            text = raw_bytes.decode("gbk")
         return text.strip() if text else "TXT文件无有效文本内容"
     except Exception as e:
         raise Exception(f"TXT读取异常：{str(e)}")
 
+def hash_file_bytes(file_bytes: bytes) -> str:
+    """上传文件内容哈希（blake2b），作为OCR/文本读取结果的缓存键"""
+    return hashlib.blake2b(file_bytes).hexdigest()
+
 # ===== 多源异构统一读取入口（核心：自动识别文件类型，按需处理）=====
-def read_legal_file(file_path: Path) -> str:
+@st.cache_data(show_spinner=False, max_entries=256, ttl=3600, hash_funcs={bytes: hash_file_bytes})
+def read_legal_file(file_bytes: bytes, suffix: str, binarize: bool = False, ocr_model: str = "system") -> str:
     """
-    自动识别文件后缀，选择对应处理方式：
+    读取上传文书原始内容（按文件内容哈希缓存，重复提取同一文件无需再次OCR），
+    文件内容以内存文件流直接交给各读取函数，不落盘临时文件；按文件后缀选择对应处理方式：
     1. DOCX/TXT/可编辑PDF → 直接提取文本
-    2. 扫描件PDF/图片 → 先Tesseract OCR → 提取文本
+    2. 扫描件PDF/图片 → 先Tesseract OCR → 提取文本（binarize=True时先灰度二值化预处理，ocr_model选择system/fast/best识别模型）
     """
-    file_suffix = file_path.suffix.lower()
+    file_suffix = suffix.lower()
+    file_stream = io.BytesIO(file_bytes)
     # 处理DOCX
     if file_suffix == ".docx":
-        return read_docx_file(file_path)
+        return read_docx_file(file_stream)
     # 处理PDF（自动区分可编辑/扫描件）
     elif file_suffix == ".pdf":
+        pdf_text = None
         try:
-            pdf_text = read_pdf_file(file_path)
-            if pdf_text not in ["PDF无有效文本内容", ""]:
-                return pdf_text
-            else:
-                st.warning(f"⚠️ 检测到【{file_path.name}】为扫描件PDF，启动Tesseract OCR识别...")
-                return tesseract_ocr_scanned_pdf(file_path)
-        except:
-            st.warning(f"⚠️ 检测到【{file_path.name}】为扫描件PDF，启动Tesseract OCR识别...")
-            return tesseract_ocr_scanned_pdf(file_path)
+            # 先用前几页快速探测，扫描件直接OCR，不再逐页解析全部空白文本层
+            if _pdf_has_text(file_stream):
+                pdf_text = read_pdf_file(file_stream)
+        except Exception:
+            # 文本层解析失败（如PDF结构异常）只记录日志，按扫描件处理；OCR异常不再重复识别，直接上报
+            logger.exception("可编辑PDF文本提取失败，改用Tesseract OCR识别")
+        if not pdf_text or pdf_text.startswith("PDF无有效"):
+            st.warning("⚠️ 检测到扫描件PDF，启动Tesseract OCR识别...")
+            pdf_text = tesseract_ocr_scanned_pdf(file_stream, binarize, ocr_model)
+        return pdf_text
     # 处理图片（JPG/PNG/BMP）
     elif file_suffix in [".jpg", ".jpeg", ".png", "bmp"]:
-        st.warning(f"⚠️ 检测到【{file_path.name}】为图片文件，启动Tesseract OCR识别...")
-        return tesseract_ocr_image(file_path.absolute())
+        st.warning("⚠️ 检测到图片文件，启动Tesseract OCR识别...")
+        return tesseract_ocr_image(file_stream, binarize, ocr_model)
     # 处理TXT
     elif file_suffix == ".txt":
-        return read_txt_file(file_path)
+        return read_txt_file(file_stream)
     # 不支持的格式
     else:
         raise Exception(f"不支持的文件格式：{file_suffix}，请上传DOCX/PDF/TXT/JPG/PNG")
 
 # ===== DeepSeek API大模型结构化提取（Mac本地版，密钥仅本地使用）=====
-def extract_legal_data(text: str, api_key: str) -> dict:
-    """
-    调用DeepSeek API提取法律结构化要素：
-    1. 严格按配置字段提取，补全缺失字段
-    2. 统一输出格式，确保Excel导出无报错
-    3. 低温度设置，保证提取结果稳定性
-    """
-    # 初始化OpenAI客户端（DeepSeek兼容OpenAI接口）
-    client = openai.OpenAI(
-        api_key=api_key,
-        base_url=DEEPSEEK_API_BASE
-    )
-    # 拼接提取字段，生成专业法律提取Prompt
-    extract_fields = "、".join(REQUIRED_FIELDS)
-    prompt = f"""
+# 专业法律提取Prompt的静态指令部分（模块加载时生成一次，调用时只拼接文书原文）
+_FIELDS_STR = "、".join(REQUIRED_FIELDS)
+_PROMPT_PREFIX = f"""
 你是资深法院书记员，擅长精准提取各类裁判文书的核心法律结构化要素，严格按照以下要求执行：
-1. 必须提取的核心字段：{extract_fields}
+1. 必须提取的核心字段：{_FIELDS_STR}
 2. 提取硬性规则（严格遵守）：
    - 判决日期统一格式化为【YYYY-MM-DD】，无明确判决时间则填「未提及」；
    - 多个原告/被告/申请人/被申请人/案由用【顿号、】分隔，无相关信息则填「未提及」；
@@ -201,18 +383,49 @@ def extract_legal_data(text: str, api_key: str) -> dict:
    - 所有value均为**字符串类型**，空值/无相关信息统一填「未提及」，禁止出现null/None。
 
 【裁判文书原文（含OCR识别内容）】
-{text[:TEXT_CUT_LENGTH]}
+"""
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _client(api_key: str) -> openai.OpenAI:
+    """按API Key复用OpenAI客户端（DeepSeek兼容OpenAI接口）：共享HTTP/2长连接池，避免每份文书重复TLS握手"""
+    return openai.OpenAI(
+        api_key=api_key,
+        base_url=DEEPSEEK_API_BASE,
+        http_client=httpx.Client(http2=True, limits=httpx.Limits(max_keepalive_connections=32))
+    )
+
+@st.cache_data(show_spinner=False, max_entries=256, ttl=3600)
+def extract_legal_data(text: str, _api_key: str) -> dict:
+    """
+    调用DeepSeek API提取法律结构化要素（按文书文本缓存，API Key不参与缓存键）：
+    1. 严格按配置字段提取，补全缺失字段
+    2. 统一输出格式，确保Excel导出无报错
+    3. 低温度设置，保证提取结果稳定性
     """
+    # 静态指令前缀已预先生成，只需拼接截断后的文书原文
+    prompt = _PROMPT_PREFIX + text[:TEXT_CUT_LENGTH]
     try:
-        # 调用API，temperature=0.1保证结果稳定性
-        response = client.chat.completions.create(
+        client = _client(_api_key)
+        # 调用API，temperature=0.1保证结果稳定性；流式接收，with块保证异常时也释放连接
+        content_chunks = []
+        with client.chat.completions.create(
             model=DEEPSEEK_MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.1,
-            response_format={"type": "json_object"}  # 强制JSON输出
-        )
+            response_format={"type": "json_object"},  # 强制JSON输出
+            stream=True
+        ) as stream:
+            # 逐块拼接返回内容，收到finish_reason即结束
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta.content:
+                    content_chunks.append(choice.delta.content)
+                if choice.finish_reason is not None:
+                    break
         # 解析API返回结果
-        legal_result_dict = json.loads(response.choices[0].message.content.strip())
+        legal_result_dict = json.loads("".join(content_chunks).strip())
         # 补全缺失字段（防止API漏返，确保Excel表头完整）
         for field in REQUIRED_FIELDS:
             if field not in legal_result_dict or not str(legal_result_dict[field]).strip():
@@ -221,28 +434,107 @@ def extract_legal_data(text: str, api_key: str) -> dict:
     except Exception as e:
         raise Exception(f"大模型结构化提取异常：{str(e)}")
 
-# ===== Excel导出函数（Mac本地专属，直接保存到桌面）=====
-def save_legal_excel(result_list: list) -> Path:
+# ===== 批量处理流水线（OCR与大模型请求重叠执行）=====
+async def process_legal_batch(uploaded_files: list, api_key: str, binarize: bool = False, ocr_model: str = "system",
+                              on_file_done=None) -> list:
+    """
+    流水线批量处理上传文书：
+    1. 文本读取/OCR在后台线程逐份执行，读完一份立即发起该份的大模型请求
+    2. 下一份文书的OCR与前面文书的大模型请求同时进行，总耗时≈max(OCR总耗时, 大模型总耗时)
+    3. 内容完全相同的文件（SHA-256一致）只处理一次，重复文件直接复用结果
+    4. 每完成一份回调on_file_done(已完成数量)，返回结果与uploaded_files一一对应，失败项为对应的异常对象
     """
-    提取结果导出为标准化Excel：
+    loop = asyncio.get_running_loop()
+    # 信号量限制同时在途请求数，避免触发DeepSeek单Key并发限制
+    semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    script_run_ctx = get_script_run_ctx()
+
+    def run_with_script_ctx(func, *args):
+        # 后台线程挂载当前页面上下文，保证st.warning提示和缓存正常工作
+        add_script_run_ctx(threading.current_thread(), script_run_ctx)
+        return func(*args)
+
+    async def process_one(uploaded_file) -> dict:
+        file_raw_text = await loop.run_in_executor(
+            reader_pool, run_with_script_ctx,
+            read_legal_file, uploaded_file.getvalue(), Path(uploaded_file.name).suffix, binarize, ocr_model
+        )
+        async with semaphore:
+            # 大模型请求为同步缓存函数，放到线程中执行，多份文书仍可并发
+            return await asyncio.to_thread(run_with_script_ctx, extract_legal_data, file_raw_text, api_key)
+
+    # 按文件内容去重：同一批次重复上传的文件只保留首个进行OCR/大模型提取
+    file_hash_list = [hashlib.sha256(uploaded_file.getbuffer()).hexdigest() for uploaded_file in uploaded_files]
+    unique_files = {}
+    for file_hash, uploaded_file in zip(file_hash_list, uploaded_files):
+        unique_files.setdefault(file_hash, uploaded_file)
+
+    # 单个读取线程即可：扫描件PDF的各页OCR已在OCR线程池中并行
+    reader_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="legal-file-reader")
+    tasks = {file_hash: asyncio.ensure_future(process_one(uploaded_file)) for file_hash, uploaded_file in unique_files.items()}
+    try:
+        # 每个任务完成时，其对应的全部重复文件一并计入已完成数量
+        task_file_counts = {task: file_hash_list.count(file_hash) for file_hash, task in tasks.items()}
+        pending_tasks = set(tasks.values())
+        done_count = 0
+        while pending_tasks:
+            done_tasks, pending_tasks = await asyncio.wait(pending_tasks, return_when=asyncio.FIRST_COMPLETED)
+            done_count += sum(task_file_counts[task] for task in done_tasks)
+            if on_file_done is not None:
+                on_file_done(done_count)
+    finally:
+        # 中途被打断（如用户点击停止/页面重新运行）时取消排队中的读取任务，不等待剩余文件OCR完成
+        for task in tasks.values():
+            task.cancel()
+        reader_pool.shutdown(wait=False, cancel_futures=True)
+
+    batch_result_list = []
+    for file_hash in file_hash_list:
+        task = tasks[file_hash]
+        # 成功结果复制一份，避免重复文件共用同一个字典（后续会分别写入各自的文件名）
+        batch_result_list.append(task.exception() if task.exception() is not None else dict(task.result()))
+    return batch_result_list
+
+# ===== 结果导出函数（Mac本地专属，直接保存到桌面）=====
+def _excel_cell_value(value):
+    """只写模式的openpyxl不接受列表/字典等单元格值（大模型偶发返回数组），非标量统一转字符串"""
+    return value if isinstance(value, (str, int, float, type(None))) else str(value)
+
+def save_legal_excel(result_list: list, fmt: str = "xlsx") -> Path:
+    """
+    提取结果导出为标准化表格（fmt可选xlsx/csv/parquet，大批量建议csv/parquet，写入更快、文件更小）：
     1. 自动保存到Mac桌面，文件名含时间戳（避免重复）
     2. 列顺序：文件名→提取时间→核心法律字段（方便查看）
     3. 无索引列，直接用于数据分析/类案研判
     """
     try:
-        # 转换为Pandas DataFrame，调整列顺序（溯源字段放最前）
-        result_df = pd.DataFrame(result_list)
+        # 列顺序：溯源字段放最前
         col_order = ["文件名", "提取时间"] + REQUIRED_FIELDS
-        result_df = result_df[col_order]
         # 生成保存路径（Mac桌面 + 时间戳 + 固定前缀）
         mac_desktop = Path.home() / "Desktop"  # Mac桌面默认路径，无需修改
         time_stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        excel_save_path = mac_desktop / f"裁判文书提取结果_{time_stamp}.xlsx"
-        # 保存为Excel，不生成索引列
-        result_df.to_excel(excel_save_path, index=False, engine="openpyxl")
-        return excel_save_path
+        export_save_path = mac_desktop / f"裁判文书提取结果_{time_stamp}.{fmt}"
+        if fmt == "xlsx":
+            # 只写模式流式逐行写入Excel，不构建DataFrame，内存占用与行数无关
+            workbook = Workbook(write_only=True)
+            worksheet = workbook.create_sheet("Sheet1")
+            worksheet.append(col_order)
+            for result in result_list:
+                worksheet.append([_excel_cell_value(result.get(col, "")) for col in col_order])
+            workbook.save(export_save_path)
+        elif fmt == "csv":
+            # pandas C写入器；utf-8-sig带BOM，Mac/Windows的Excel直接打开中文不乱码
+            result_df = pd.DataFrame(result_list, columns=col_order).fillna("")
+            result_df.to_csv(export_save_path, index=False, encoding="utf-8-sig")
+        elif fmt == "parquet":
+            # Arrow列式存储 + zstd压缩；统一转字符串，避免大模型偶发返回的非字符串值导致列类型冲突
+            result_df = pd.DataFrame(result_list, columns=col_order).fillna("").astype(str)
+            result_df.to_parquet(export_save_path, index=False, engine="pyarrow", compression="zstd")
+        else:
+            raise Exception(f"不支持的导出格式：{fmt}，请选择xlsx/csv/parquet")
+        return export_save_path
     except Exception as e:
-        raise Exception(f"Excel导出异常：{str(e)}")
+        raise Exception(f"{EXPORT_FORMATS.get(fmt, fmt)}导出异常：{str(e)}")
 
 # ===== Streamlit可视化主界面（Mac本地版，简洁友好）=====
 def main():
@@ -253,16 +545,27 @@ def main():
         layout="wide",
         initial_sidebar_state="expanded"
     )
+    # 初始化Tesseract（进程内只检查一次，后续交互直接复用结果；提示在缓存外展示）
+    tessdata_path, _, tesseract_error = init_tesseract()
+    if tesseract_error:
+        st.error(f"❌ Tesseract配置失败：{tesseract_error}")
+        st.info("💡 请确认packages.txt在根目录，且包含tesseract-ocr、tesseract-ocr-chi-sim")
+        # st.stop()只结束本次脚本执行并保留错误提示；sys.exit会在脚本线程抛出SystemExit，页面直接崩溃
+        st.stop()
+    # 配置成功提示每个会话只弹一次，避免每次交互重复弹出
+    if not st.session_state.get("tesseract_toast_shown"):
+        st.toast(f"✅ Tesseract配置成功，语言包路径：{tessdata_path}", icon="☁️")
+        st.session_state.tesseract_toast_shown = True
     # 页面主标题和说明
     st.title("📜 Mac 多源异构裁判文书结构化提取工具")
-    st.subheader("✨ 支持 DOCX/可编辑PDF/扫描件PDF/JPG/PNG/TXT | 批量处理 | Excel导出")
+    st.subheader("✨ 支持 DOCX/可编辑PDF/扫描件PDF/JPG/PNG/TXT | 批量处理 | Excel/CSV/Parquet导出")
     st.markdown("---")
     # 工具使用说明（Mac本地版，简洁明了）
     st.markdown("### 📌 本地使用说明")
     st.markdown("1. 数据**全程本地处理**，无上传、无存储，涉密文书可放心使用；")
     st.markdown("2. 需自行前往 [DeepSeek官网](https://platform.deepseek.com/) 获取**免费API Key**（每月额度覆盖300+份）；")
     st.markdown("3. 支持**多文件批量上传**，自动识别格式，扫描件/图片自动OCR；")
-    st.markdown("4. 提取结果**直接保存到Mac桌面**，Excel格式可直接用于数据分析/类案研判。")
+    st.markdown("4. 提取结果**直接保存到Mac桌面**，Excel/CSV/Parquet格式可直接用于数据分析/类案研判。")
     st.markdown("---")
 
     # 侧边栏：API密钥配置（核心，仅本地输入，不存储）
@@ -274,6 +577,31 @@ def main():
             placeholder="sk-xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx",
             help="👉 前往 https://platform.deepseek.com/ 注册免费获取，密钥仅本地使用"
         )
+        # OCR识别设置（两项相互独立）：二值化是识别前的图片预处理，识别模型决定Tesseract使用哪套语言包
+        binarize = st.toggle(
+            "🖤 图片二值化预处理",
+            value=False,
+            help="识别前先把扫描件/图片转为黑白二值图，速度更快、内存占用更低；复杂底纹或印章较多的文书建议关闭。与下方识别模型选择无关"
+        )
+        ocr_model = st.radio(
+            "🎯 OCR识别模型",
+            options=["system", "fast", "best"],
+            format_func={
+                "system": "系统默认语言包（无需下载）",
+                "fast": "tessdata_fast（整数量化，速度最快）",
+                "best": "tessdata_best（浮点模型，精度最高、速度较慢）",
+            }.get,
+            help="系统自带语言包通常即为fast版本；fast比best快3-5倍，印刷体文书精度损失约1-2个百分点。"
+                 "首次选择fast/best提取时需联网下载对应模型语言包（仅下载模型文件，不上传文书），"
+                 "下载失败则本次使用系统默认语言包。与上方二值化预处理无关"
+        )
+        # 导出格式：大批量结果建议CSV/Parquet，写入速度快5-20倍
+        export_fmt = st.radio(
+            "📄 结果导出格式",
+            options=list(EXPORT_FORMATS),
+            format_func=EXPORT_FORMATS.get,
+            help="Excel适合直接查看；500份以上的大批量结果建议选择CSV或Parquet"
+        )
         # 提取字段提示
         st.info(f"✅ 固定提取字段：\n{chr(10).join(REQUIRED_FIELDS)}")
         st.success("💡 提取结果自动保存到【Mac桌面】，文件名含时间戳")
@@ -297,50 +625,51 @@ def main():
 
     # 批量处理核心逻辑
     if extract_button:
-        # 清空历史结果，避免累积
+        # 清空历史结果，避免累积（预览表格随结果一并失效，预览时重新生成）
         st.session_state.result_list.clear()
+        st.session_state.pop("result_dataframe", None)
         total_file_count = len(uploaded_files)
         st.info(f"📊 开始批量处理 → 共{total_file_count}个文件，正在逐份识别/提取...")
         # 进度条和实时状态提示
         progress_bar = st.progress(0)
         status_text = st.empty()
 
-        # 遍历所有上传文件，逐份处理
-        for file_index, uploaded_file in enumerate(uploaded_files, 1):
+        def update_progress(done_count: int):
             # 更新实时处理进度
-            process_progress = file_index / total_file_count
-            progress_bar.progress(process_progress)
-            status_text.text(f"处理中：{file_index}/{total_file_count} → 【{uploaded_file.name}】")
+            progress_bar.progress(done_count / total_file_count)
+            status_text.text(f"处理中：已完成{done_count}/{total_file_count}个文件")
 
-            try:
-                # 将上传的临时文件保存为Mac本地临时文件（处理后自动删除）
-                with tempfile.NamedTemporaryFile(delete=False, suffix=Path(uploaded_file.name).suffix) as local_tmp_file:
-                    local_tmp_file.write(uploaded_file.getbuffer())
-                    local_tmp_file_path = Path(local_tmp_file.name)
-
-                # 核心：多源异构文件统一读取（自动识别格式+按需OCR）
-                file_raw_text = read_legal_file(local_tmp_file_path)
-                # 调用DeepSeek API进行结构化提取
-                legal_struct_data = extract_legal_data(file_raw_text, deepseek_api_key)
+        # 选择fast/best模型时才检查/下载语言包，失败则本次回退系统默认语言包（下次点击提取会重试下载）
+        if ocr_model in TESSDATA_MODEL_DIRS:
+            with st.spinner(f"正在准备{ocr_model}模型语言包..."):
+                model_tessdata_error = ensure_model_tessdata(ocr_model)
+            if model_tessdata_error:
+                st.warning(f"⚠️ {ocr_model}模型语言包下载失败，本次OCR使用系统默认语言包：{model_tessdata_error}")
+                ocr_model = "system"
+
+        # 流水线处理：逐份读取/OCR，读完即并发调用DeepSeek API进行结构化提取
+        batch_result_list = asyncio.run(process_legal_batch(
+            uploaded_files, deepseek_api_key, binarize=binarize, ocr_model=ocr_model, on_file_done=update_progress
+        ))
+
+        # 按上传顺序汇总结果
+        for uploaded_file, legal_struct_data in zip(uploaded_files, batch_result_list):
+            if not isinstance(legal_struct_data, Exception):
                 # 补充溯源信息：原始文件名、提取时间（方便后续排查/整理）
                 legal_struct_data["文件名"] = uploaded_file.name
                 legal_struct_data["提取时间"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 # 添加到结果列表
                 st.session_state.result_list.append(legal_struct_data)
                 st.success(f"✅ 处理成功：【{uploaded_file.name}】")
-
-            except Exception as e:
+            else:
                 # 异常处理：标记提取失败，记录失败原因，保留基础信息
+                e = legal_struct_data
                 error_data = {field: "提取失败" for field in REQUIRED_FIELDS}
                 error_data["文件名"] = uploaded_file.name
                 error_data["提取时间"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 error_data["文书名称"] = f"失败原因：{str(e)[:50]}..."  # 截取原因，避免界面冗余
                 st.session_state.result_list.append(error_data)
                 st.error(f"❌ 处理失败：【{uploaded_file.name}】→ {str(e)}")
-            finally:
-                # 强制删除本地临时文件，释放Mac内存和磁盘空间
-                if 'local_tmp_file_path' in locals() and local_tmp_file_path.exists():
-                    local_tmp_file_path.unlink(missing_ok=True)
 
         # 批量处理完成，更新最终状态
         progress_bar.progress(100)
@@ -350,24 +679,27 @@ def main():
         status_text.text(f"🎉 批量处理完成！✅成功{success_count}个 | ❌失败{fail_count}个")
         st.balloons()  # 处理完成动画提示
 
-    # 提取结果预览 + Excel一键导出（有结果时显示）
+    # 提取结果预览 + 一键导出（有结果时显示）
     if st.session_state.result_list:
         st.markdown("---")
         # 结果实时预览（隐藏索引，自适应宽布局）
         st.header("📊 提取结果实时预览")
-        result_dataframe = pd.DataFrame(st.session_state.result_list)
-        result_dataframe = result_dataframe[["文件名", "提取时间"] + REQUIRED_FIELDS]
-        st.dataframe(result_dataframe, use_container_width=True, hide_index=True)
+        # 预览表格缓存在会话状态中，仅在新一批结果生成后重建，其他交互（按钮/侧边栏）直接复用
+        if st.session_state.get("result_dataframe") is None:
+            st.session_state.result_dataframe = pd.DataFrame(
+                st.session_state.result_list, columns=["文件名", "提取时间"] + REQUIRED_FIELDS
+            )
+        st.dataframe(st.session_state.result_dataframe, use_container_width=True, hide_index=True)
 
-        # Excel一键导出（保存到Mac桌面）
-        st.header("📥 Excel结果导出（直接保存到桌面）")
+        # Excel/CSV/Parquet一键导出（保存到Mac桌面）
+        st.header(f"📥 {EXPORT_FORMATS[export_fmt]}结果导出（直接保存到桌面）")
         if st.button("💾 一键导出到Mac桌面", type="secondary"):
             try:
-                excel_path = save_legal_excel(st.session_state.result_list)
-                st.success(f"✅ Excel导出成功！保存路径：\n{excel_path}")
+                export_path = save_legal_excel(st.session_state.result_list, export_fmt)
+                st.success(f"✅ {EXPORT_FORMATS[export_fmt]}导出成功！保存路径：\n{export_path}")
                 st.info("💡 文件已保存到Mac桌面，可直接打开进行数据分析/类案研判")
             except Exception as e:
-                st.error(f"❌ Excel导出失败：{str(e)}")
+                st.error(f"❌ {EXPORT_FORMATS[export_fmt]}导出失败：{str(e)}")
 
 # ===== 程序主入口（Mac本地运行必备）=====
 if __name__ == "__main__":
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+APP_PATH = Path(__file__).resolve().parents[1] / "legal_extract_app2.py"
+
+# 在全新解释器中运行：pytest收集其他测试时已在主线程导入过依赖，同进程内测不出非主线程导入问题
+_SMOKE_SCRIPT = """
+import sys
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=60).run()
+assert not app.exception, [e.message for e in app.exception]
+print(app.title[0].value)
+"""
+
+
+def test_app_page_loads(tmp_path):
+    # Streamlit在ScriptRunner线程（非主线程）执行脚本，依赖导入不得注册信号处理；
+    # 语言包只做存在性检查，用空文件占位即可通过Tesseract初始化
+    for lang in ("chi_sim", "eng"):
+        (tmp_path / f"{lang}.traineddata").touch()
+    env = {**os.environ, "TESSDATA_PREFIX": f"{tmp_path}/"}
+
+    proc = subprocess.run(
+        [sys.executable, "-c", _SMOKE_SCRIPT, str(APP_PATH)],
+        env=env, capture_output=True, text=True, timeout=180
+    )
+
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert "📜 Mac 多源异构裁判文书结构化提取工具" in proc.stdout
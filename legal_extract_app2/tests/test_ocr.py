@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+
+APP_PATH = Path(__file__).resolve().parents[1] / "legal_extract_app2.py"
+_spec = importlib.util.spec_from_file_location("legal_extract_app2", APP_PATH)
+app = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(app)
+
+
+def test_adaptive_ocr_keeps_higher_confidence_pass(monkeypatch):
+    # 页面用(分辨率, 页码)占位，识别结果按占位查表，不依赖真实PDF和语言包
+    monkeypatch.setattr(app, "_render_pdf_pages", lambda pdf_source, dpi, page_nums=None: [
+        (dpi, page_num) for page_num in (page_nums or [1, 2, 3])
+    ])
+    ocr_results = {
+        (app.OCR_FAST_DPI, 1): ("第1页清晰", 90),
+        (app.OCR_FAST_DPI, 2): ("第2页低清", 50),
+        (app.OCR_FAST_DPI, 3): ("第3页噪点", 60),
+        (app.OCR_FULL_DPI, 2): ("第2页高清", 85),
+        (app.OCR_FULL_DPI, 3): ("第3页噪点放大", 40),
+    }
+    monkeypatch.setattr(app, "_ocr_pil_image_with_conf", lambda img, binarize=False, ocr_model="system": ocr_results[img])
+
+    assert app._adaptive_ocr(None) == ["第1页清晰", "第2页高清", "第3页噪点"]
+
+
+def _numpy_otsu_threshold(gray_arr: np.ndarray) -> int:
+    """NumPy向量化的Otsu参考实现：类间方差最大的灰度值（并列取最小值）"""
+    hist = np.bincount(gray_arr.ravel(), minlength=256).astype(np.float64)
+    weight_bg = np.cumsum(hist)
+    weight_fg = gray_arr.size - weight_bg
+    sum_bg = np.cumsum(hist * np.arange(256))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between_var = weight_bg * weight_fg * (sum_bg / weight_bg - (sum_bg[-1] - sum_bg) / weight_fg) ** 2
+    between_var[(weight_bg == 0) | (weight_fg == 0)] = -1.0
+    return int(np.argmax(between_var))
+
+
+def test_otsu_binarize_matches_numpy_reference():
+    rng = np.random.default_rng(0)
+    # 深色文字 + 浅色纸张的双峰灰度图，再叠加一张均匀噪声图
+    bimodal = np.where(rng.random((120, 90)) < 0.3, rng.normal(60, 15, (120, 90)), rng.normal(200, 20, (120, 90)))
+    noise = rng.integers(0, 256, (64, 64))
+    for gray_arr in (np.clip(bimodal, 0, 255).astype(np.uint8), noise.astype(np.uint8)):
+        threshold = _numpy_otsu_threshold(gray_arr)
+        expected = np.where(gray_arr > threshold, 255, 0).astype(np.uint8)
+        np.testing.assert_array_equal(app._otsu_binarize(gray_arr), expected)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import importlib.util
+import io
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+APP_PATH = Path(__file__).resolve().parents[1] / "legal_extract_app2.py"
+_spec = importlib.util.spec_from_file_location("legal_extract_app2", APP_PATH)
+app = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(app)
+
+
+class FakeUploadedFile(io.BytesIO):
+    """模拟st.file_uploader返回的UploadedFile（BytesIO子类 + 文件名）"""
+
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name = name
+
+
+def test_process_legal_batch_dedupes_and_keeps_upload_order(monkeypatch):
+    read_calls = []
+
+    def fake_read(file_bytes, suffix, binarize=False, ocr_model="system"):
+        read_calls.append(file_bytes)
+        return file_bytes.decode()
+
+    def fake_extract(text, _api_key):
+        if text == "损坏文书":
+            raise Exception("大模型结构化提取异常：模拟失败")
+        # 首份文书最慢完成，验证结果仍按上传顺序返回
+        if text == "判决书A":
+            time.sleep(0.2)
+        return {"文书名称": text}
+
+    monkeypatch.setattr(app, "read_legal_file", fake_read)
+    monkeypatch.setattr(app, "extract_legal_data", fake_extract)
+    uploaded_files = [
+        FakeUploadedFile("a.txt", "判决书A".encode()),
+        FakeUploadedFile("b.txt", "损坏文书".encode()),
+        FakeUploadedFile("a_copy.txt", "判决书A".encode()),
+        FakeUploadedFile("d.txt", "判决书D".encode()),
+    ]
+    done_counts = []
+
+    results = asyncio.run(app.process_legal_batch(uploaded_files, "sk-test", on_file_done=done_counts.append))
+
+    # 重复文件只读取一次，但各自拿到独立的结果字典
+    assert sorted(read_calls) == sorted(["判决书A".encode(), "损坏文书".encode(), "判决书D".encode()])
+    assert results[0] == results[2] == {"文书名称": "判决书A"}
+    assert results[0] is not results[2]
+    # 失败项只占自己那一行
+    assert isinstance(results[1], Exception)
+    assert results[3] == {"文书名称": "判决书D"}
+    # 重复文件随首个文件一并计入进度
+    assert done_counts[-1] == len(uploaded_files)
+    assert done_counts == sorted(done_counts)
+
+
+def test_process_legal_batch_interrupt_skips_queued_reads(monkeypatch):
+    read_calls = []
+    first_read_started = threading.Event()
+    release_first_read = threading.Event()
+
+    def fake_read(file_bytes, suffix, binarize=False, ocr_model="system"):
+        read_calls.append(file_bytes)
+        first_read_started.set()
+        release_first_read.wait(5)
+        return file_bytes.decode()
+
+    monkeypatch.setattr(app, "read_legal_file", fake_read)
+    monkeypatch.setattr(app, "extract_legal_data", lambda text, _api_key: {"文书名称": text})
+    uploaded_files = [FakeUploadedFile(f"{i}.txt", f"文书{i}".encode()) for i in range(5)]
+
+    async def interrupt_during_first_read():
+        batch_task = asyncio.ensure_future(app.process_legal_batch(uploaded_files, "sk-test"))
+        await asyncio.to_thread(first_read_started.wait, 5)
+        # 模拟页面重新运行打断批次：取消后应立即返回，不等待排队中的文件读取
+        batch_task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await batch_task
+
+    asyncio.run(interrupt_during_first_read())
+    release_first_read.set()
+    time.sleep(0.2)
+
+    assert read_calls == ["文书0".encode()]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+from pathlib import Path
+
+import fitz
+
+APP_PATH = Path(__file__).resolve().parents[1] / "legal_extract_app2.py"
+_spec = importlib.util.spec_from_file_location("legal_extract_app2", APP_PATH)
+app = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(app)
+
+
+def _text_pdf_bytes(page_texts: list) -> bytes:
+    with fitz.open() as pdf_doc:
+        for page_text in page_texts:
+            pdf_doc.new_page().insert_text((72, 72), page_text)
+        return pdf_doc.tobytes()
+
+
+def test_read_legal_file_editable_pdf_reads_all_pages_after_probe(monkeypatch):
+    # 探测与正文读取共用同一个内存文件流：探测后仍须读到全部页面，且不应走OCR
+    monkeypatch.setattr(app, "tesseract_ocr_scanned_pdf", lambda *args: "不应调用OCR")
+    page_texts = [f"Case No. 2024-{page_num:03d}" for page_num in range(1, app.PDF_TEXT_PROBE_PAGES + 3)]
+
+    pdf_text = app.read_legal_file(_text_pdf_bytes(page_texts), ".pdf")
+
+    assert pdf_text.splitlines() == page_texts
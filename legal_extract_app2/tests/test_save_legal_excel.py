@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+from pathlib import Path
+
+from openpyxl import load_workbook
+
+APP_PATH = Path(__file__).resolve().parents[1] / "legal_extract_app2.py"
+_spec = importlib.util.spec_from_file_location("legal_extract_app2", APP_PATH)
+app = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(app)
+
+
+def test_save_legal_excel_stringifies_list_values(tmp_path, monkeypatch):
+    # 导出目录指向临时桌面，避免写入真实Mac桌面
+    monkeypatch.setattr(Path, "home", lambda: tmp_path)
+    (tmp_path / "Desktop").mkdir()
+    result = {field: "未提及" for field in app.REQUIRED_FIELDS}
+    result.update({"文件名": "判决书.pdf", "提取时间": "2024-01-01 00:00:00", "原告/申请人": ["张三", "李四"]})
+
+    export_path = app.save_legal_excel([result])
+
+    rows = list(load_workbook(export_path).active.iter_rows(values_only=True))
+    row = dict(zip(rows[0], rows[1]))
+    assert row["原告/申请人"] == str(["张三", "李四"])
+    assert row["文件名"] == "判决书.pdf"